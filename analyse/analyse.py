@@ -1,5 +1,80 @@
+import numpy as np
 import pandas as pd
-from typing import List, Dict, Any, Optional
+from collections import deque
+from typing import List, Dict, Any, Mapping, Optional
+
+class SeasonalBaseline:
+    """
+    Ligne de base saisonnière : moyenne et écart-type de chaque métrique par
+    créneau (jour de la semaine x heure), précalculés dans une table de lookup.
+    La table contient 7*24 lignes "jour x heure" suivies de 24 lignes "heure
+    seule", utilisées en repli quand un créneau hebdomadaire a trop peu
+    d'échantillons. Les statistiques sont mises à jour de façon incrémentale
+    (algorithme de Welford) ; les données déjà couvertes par `fit` ne sont
+    pas réintégrées. Les créneaux sont calculés dans le fuseau `timezone`
+    (les timestamps sans fuseau sont considérés comme UTC).
+    """
+    WEEKLY_BUCKETS = 7 * 24
+    HOURLY_BUCKETS = 24
+
+    def __init__(self, metrics: List[str], min_samples: int = 10, timezone: str = 'UTC'):
+        self.metrics = list(metrics)
+        self.min_samples = min_samples
+        self.timezone = timezone
+        self.fitted_until: Optional[float] = None  # Dernier timestamp (epoch) vu par `fit`
+        shape = (self.WEEKLY_BUCKETS + self.HOURLY_BUCKETS, len(self.metrics))
+        self.count = np.zeros(shape)
+        self.mean = np.zeros(shape)
+        self.m2 = np.zeros(shape)  # Somme des carrés des écarts à la moyenne
+
+    def buckets(self, timestamp: Any) -> tuple:
+        """Retourne les lignes (jour x heure, heure seule) correspondant à un timestamp."""
+        ts = pd.Timestamp(timestamp)
+        if ts.tzinfo is None:
+            ts = ts.tz_localize('UTC')
+        ts = ts.tz_convert(self.timezone)
+        return ts.dayofweek * 24 + ts.hour, self.WEEKLY_BUCKETS + ts.hour
+
+    def fit(self, df: pd.DataFrame):
+        """Construit la table à partir d'un jeu de données historique."""
+        ts = pd.to_datetime(df['timestamp'], utc=True).dt.tz_convert(self.timezone)
+        if len(ts):
+            self.fitted_until = ts.max().timestamp()
+        weekly = ts.dt.dayofweek * 24 + ts.dt.hour
+        hourly = self.WEEKLY_BUCKETS + ts.dt.hour
+        for i, metric in enumerate(self.metrics):
+            if metric not in df.columns:
+                continue
+            for keys in (weekly, hourly):
+                stats = df[metric].groupby(keys).agg(['count', 'mean', 'var'])
+                rows = stats.index.to_numpy()
+                self.count[rows, i] = stats['count'].to_numpy()
+                self.mean[rows, i] = stats['mean'].to_numpy()
+                self.m2[rows, i] = (stats['var'].fillna(0) * (stats['count'] - 1)).to_numpy()
+
+    def is_new(self, timestamp: Any) -> bool:
+        """Indique si un timestamp est postérieur aux données utilisées par `fit`."""
+        return self.fitted_until is None or pd.Timestamp(timestamp).timestamp() > self.fitted_until
+
+    def lookup(self, buckets: tuple, metric_index: int) -> Optional[tuple]:
+        """
+        Retourne (moyenne, écart-type) du créneau le plus précis ayant assez
+        d'échantillons, ou None si aucun ne convient.
+        """
+        for row in buckets:
+            n = self.count[row, metric_index]
+            if n >= max(self.min_samples, 2):
+                return self.mean[row, metric_index], np.sqrt(self.m2[row, metric_index] / (n - 1))
+        return None
+
+    def update(self, buckets: tuple, metric_index: int, value: float):
+        """Intègre une nouvelle valeur dans les créneaux concernés."""
+        for row in buckets:
+            self.count[row, metric_index] += 1
+            delta = value - self.mean[row, metric_index]
+            self.mean[row, metric_index] += delta / self.count[row, metric_index]
+            self.m2[row, metric_index] += delta * (value - self.mean[row, metric_index])
+
 
 class AnomalyDetector:
     """
@@ -10,6 +85,10 @@ class AnomalyDetector:
     3. Écart-type par rapport à une moyenne glissante (pour détecter les déviations récentes).
     4. Différence (delta) par rapport à la valeur précédente (pour détecter les hausses brusques).
     5. Statut direct des services (offline/degraded).
+    6. (Optionnel, désactivé par défaut) Écart-type par rapport à une ligne de
+       base saisonnière (par jour de la semaine et heure). Lorsqu'elle est
+       activée, elle remplace le contrôle sur l'écart-type global pour tout
+       créneau disposant d'au moins `min_samples` échantillons.
     """
 
     def __init__(self, config: Dict[str, Any]):
@@ -21,7 +100,19 @@ class AnomalyDetector:
         """
         self.config = config
         self.global_stats = {}  # Pour stocker les moyennes et écarts-types globaux
-        self.history = pd.DataFrame() # Pour stocker l'historique des données reçues
+        # Historique glissant des valeurs reçues, une fenêtre bornée par métrique
+        window = self.config.get('rolling_window_size', 20)
+        self.history = {metric: deque(maxlen=window) for metric in self.config['metrics_to_check']}
+        self.history_length = 0  # Nombre d'enregistrements dans la fenêtre
+        # Ligne de base saisonnière, activée par la clé 'seasonal_baseline' de la configuration
+        self.seasonal_config = self.config.get('seasonal_baseline', {})
+        self.seasonal = None
+        if self.seasonal_config.get('enabled', False):
+            self.seasonal = SeasonalBaseline(
+                list(self.config['metrics_to_check']),
+                min_samples=self.seasonal_config.get('min_samples', 10),
+                timezone=self.seasonal_config.get('timezone', 'UTC'),
+            )
 
     def compute_global_stats(self, initial_df: pd.DataFrame):
         """
@@ -33,60 +124,82 @@ class AnomalyDetector:
         numeric_cols = initial_df.select_dtypes(include='number').columns
         self.global_stats['mean'] = initial_df[numeric_cols].mean()
         self.global_stats['std'] = initial_df[numeric_cols].std()
+        if self.seasonal is not None:
+            self.seasonal.fit(initial_df)
         print("✅ Détecteur prêt.")
 
-    def detect(self, record: Dict[str, Any]) -> List[str]:
+    def detect(self, record: Mapping[str, Any]) -> List[str]:
         """
         Analyse un enregistrement unique et retourne une liste des anomalies détectées.
+        L'enregistrement peut être un dict ou tout objet Mapping (ex: `MetricRecord`).
         """
         anomalies = []
         
-        # Conversion du record en Series Pandas pour faciliter les calculs
-        record_s = pd.Series(record)
-        
-        # Mise à jour de l'historique avec la nouvelle donnée
-        self.history = pd.concat([self.history, pd.DataFrame([record])], ignore_index=True)
-        # On garde une fenêtre d'historique limitée pour ne pas saturer la mémoire
+        # Mise à jour de l'historique avec la nouvelle donnée (NaN si la métrique est absente)
         window = self.config.get('rolling_window_size', 20)
-        self.history = self.history.tail(window)
+        for metric, values in self.history.items():
+            value = record.get(metric)
+            values.append(np.nan if value is None else value)
+        self.history_length = min(self.history_length + 1, window)
+
+        # Créneaux saisonniers de l'enregistrement (calculés une seule fois)
+        seasonal_buckets = None
+        seasonal_learn = False  # Les données rejouées de l'entraînement ne sont pas réintégrées
+        if self.seasonal is not None and record.get('timestamp') is not None:
+            seasonal_buckets = self.seasonal.buckets(record['timestamp'])
+            seasonal_learn = self.seasonal.is_new(record['timestamp'])
 
         # 1. Détection sur les statuts de service
-        for col in [c for c in record_s.index if 'service_status_' in c]:
-            if record_s[col] in ['offline', 'degraded']:
-                anomalies.append(f"ALERTE: Le service '{col.replace('service_status_', '')}' est {record_s[col].upper()}.")
+        for col in [c for c in record if 'service_status_' in c]:
+            if record[col] in ['offline', 'degraded']:
+                anomalies.append(f"ALERTE: Le service '{col.replace('service_status_', '')}' est {record[col].upper()}.")
 
         # 2. Détection sur les métriques numériques
-        for metric in self.config['metrics_to_check']:
-            if metric not in record_s or pd.isna(record_s[metric]):
+        for metric_index, metric in enumerate(self.config['metrics_to_check']):
+            if metric not in record or pd.isna(record[metric]):
                 continue
 
-            value = record_s[metric]
+            value = record[metric]
             conf = self.config['metrics_to_check'][metric]
             
             # Seuil statique
             if 'threshold' in conf and value > conf['threshold']:
                 anomalies.append(f"CRITIQUE: '{metric}' ({value}) dépasse le seuil de {conf['threshold']}.")
             
-            # Écart-type global
-            mean_g = self.global_stats['mean'].get(metric, 0)
-            std_g = self.global_stats['std'].get(metric, 1) # Eviter division par zéro
-            if std_g > 0 and abs(value - mean_g) > conf.get('global_std_factor', 3) * std_g:
-                 anomalies.append(f"AVERTISSEMENT: '{metric}' ({value}) est anormalement éloigné de la moyenne globale ({mean_g:.2f}).")
+            # Écart-type saisonnier (lookup du créneau), sinon écart-type global
+            seasonal_stats = None
+            if seasonal_buckets is not None:
+                seasonal_stats = self.seasonal.lookup(seasonal_buckets, metric_index)
+                if seasonal_learn:
+                    self.seasonal.update(seasonal_buckets, metric_index, value)
+
+            if seasonal_stats is not None:
+                mean_s, std_s = seasonal_stats
+                factor = self.seasonal_config.get('std_factor', conf.get('global_std_factor', 3))
+                if std_s > 0 and abs(value - mean_s) > factor * std_s:
+                    anomalies.append(f"AVERTISSEMENT: '{metric}' ({value}) est anormalement éloigné de sa moyenne habituelle pour ce créneau ({mean_s:.2f}).")
+            else:
+                mean_g = self.global_stats['mean'].get(metric, 0)
+                std_g = self.global_stats['std'].get(metric, 1) # Eviter division par zéro
+                if std_g > 0 and abs(value - mean_g) > conf.get('global_std_factor', 3) * std_g:
+                     anomalies.append(f"AVERTISSEMENT: '{metric}' ({value}) est anormalement éloigné de la moyenne globale ({mean_g:.2f}).")
             
             # Analyses basées sur l'historique (si on a assez de données)
-            if len(self.history) > 1:
-                # Moyenne glissante
-                mean_r = self.history[metric].rolling(window=window, min_periods=2).mean().iloc[-1]
-                std_r = self.history[metric].rolling(window=window, min_periods=2).std().iloc[-1]
-                if pd.notna(std_r) and std_r > 0 and abs(value - mean_r) > conf.get('rolling_std_factor', 2) * std_r:
-                    anomalies.append(f"AVERTISSEMENT: '{metric}' ({value}) dévie de sa moyenne glissante ({mean_r:.2f}).")
+            if self.history_length > 1:
+                # Moyenne glissante (au moins 2 valeurs renseignées, comme rolling(min_periods=2))
+                values = np.asarray(self.history[metric], dtype=float)
+                present = values[~np.isnan(values)]
+                if len(present) >= 2:
+                    mean_r = present.mean()
+                    std_r = present.std(ddof=1)
+                    if std_r > 0 and abs(value - mean_r) > conf.get('rolling_std_factor', 2) * std_r:
+                        anomalies.append(f"AVERTISSEMENT: '{metric}' ({value}) dévie de sa moyenne glissante ({mean_r:.2f}).")
                 
                 # Delta (hausse rapide)
-                prev_value = self.history[metric].iloc[-2]
+                prev_value = values[-2]
                 delta = value - prev_value
                 if 'delta_threshold' in conf and delta > conf['delta_threshold']:
                     anomalies.append(f"INFO: Hausse rapide de '{metric}' de {delta:.2f}.")
 
         print(f"🔍 Anomalies détectées: {anomalies}")
         return anomalies
-
@@ -0,0 +1,202 @@
+import time
+import numpy as np
+import pandas as pd
+from typing import List, Dict, Any, Optional, Tuple
+
+# Niveaux d'agrégation par défaut : (résolution en secondes, nombre d'intervalles conservés)
+DEFAULT_TIERS: List[Tuple[int, int]] = [
+    (60, 24 * 60),        # 1 minute, conservé 24 heures
+    (5 * 60, 7 * 24 * 12),  # 5 minutes, conservé 7 jours
+    (60 * 60, 90 * 24),   # 1 heure, conservé 90 jours
+]
+
+
+class RollupTier:
+    """
+    Un niveau d'agrégation à résolution fixe, stocké dans des tableaux NumPy
+    circulaires de taille bornée. Chaque intervalle de temps occupe la case
+    `numéro_intervalle % capacité` ; une case est réinitialisée lorsqu'un
+    intervalle plus récent la réutilise.
+    """
+
+    def __init__(self, resolution: int, capacity: int, n_metrics: int):
+        self.resolution = resolution
+        self.capacity = capacity
+        self.buckets = np.full(capacity, -1, dtype=np.int64)  # Numéro d'intervalle de chaque case
+        self.min = np.full((capacity, n_metrics), np.inf)
+        self.max = np.full((capacity, n_metrics), -np.inf)
+        self.sum = np.zeros((capacity, n_metrics))
+        self.count = np.zeros((capacity, n_metrics), dtype=np.int64)
+        self.last = np.full((capacity, n_metrics), np.nan)
+        self.latest_bucket = -1
+
+    def update(self, seconds: int, values: np.ndarray):
+        """Intègre un point (valeurs de toutes les métriques) à l'intervalle correspondant."""
+        bucket = seconds // self.resolution
+        slot = bucket % self.capacity
+        if self.buckets[slot] != bucket:
+            if self.buckets[slot] > bucket:
+                # Donnée plus ancienne que la rétention de ce niveau : ignorée
+                return
+            self.buckets[slot] = bucket
+            self.min[slot] = np.inf
+            self.max[slot] = -np.inf
+            self.sum[slot] = 0
+            self.count[slot] = 0
+            self.last[slot] = np.nan
+        self.latest_bucket = max(self.latest_bucket, bucket)
+
+        present = ~np.isnan(values)
+        self.min[slot, present] = np.minimum(self.min[slot, present], values[present])
+        self.max[slot, present] = np.maximum(self.max[slot, present], values[present])
+        self.sum[slot, present] += values[present]
+        self.count[slot, present] += 1
+        self.last[slot, present] = values[present]
+
+    def covers(self, start_seconds: int) -> bool:
+        """Indique si la rétention de ce niveau remonte jusqu'à `start_seconds`."""
+        oldest_bucket = self.latest_bucket - self.capacity + 1
+        return oldest_bucket * self.resolution <= start_seconds
+
+    def points_between(self, start_seconds: int, end_seconds: int) -> int:
+        """Nombre d'intervalles de ce niveau dans la plage demandée."""
+        return end_seconds // self.resolution - start_seconds // self.resolution + 1
+
+    def slots_between(self, metric_index: int, start_seconds: int, end_seconds: int) -> np.ndarray:
+        """Cases (triées chronologiquement) contenant des données pour une métrique sur la plage."""
+        mask = ((self.buckets >= start_seconds // self.resolution)
+                & (self.buckets <= end_seconds // self.resolution)
+                & (self.count[:, metric_index] > 0))
+        slots = np.flatnonzero(mask)
+        return slots[np.argsort(self.buckets[slots])]
+
+
+class MetricRollup:
+    """
+    Maintient des agrégats multi-résolution (min/max/moyenne/nombre/dernière valeur)
+    par métrique, alimentés au fil de l'ingestion.
+    Les requêtes sont servies par le niveau le plus fin qui couvre la plage
+    demandée en au plus `max_points` points : le coût d'une requête et la
+    mémoire occupée ne dépendent pas de la longueur de l'historique brut.
+    """
+
+    def __init__(self, metrics: List[str], tiers: Optional[List[Tuple[int, int]]] = None,
+                 max_future_skew: int = 300):
+        self.metrics = list(metrics)
+        self._index = {metric: i for i, metric in enumerate(self.metrics)}
+        self.tiers = [
+            RollupTier(resolution, capacity, len(self.metrics))
+            for resolution, capacity in sorted(tiers or DEFAULT_TIERS)
+        ]
+        self.first_seconds: Optional[int] = None
+        self.last_seconds: Optional[int] = None
+        # Timestamps chargés par `add_dataframe` : un enregistrement rejoué avec
+        # exactement le même timestamp est ignoré, pour ne pas le compter deux fois.
+        self.seeded_seconds = set()
+        # Tolérance (secondes) sur les timestamps dans le futur : au-delà, un
+        # point avancerait la fin de la rétention et masquerait les vraies données.
+        self.max_future_skew = max_future_skew
+
+    @staticmethod
+    def _to_seconds(timestamp: Any) -> int:
+        return int(pd.Timestamp(timestamp).timestamp())
+
+    def add(self, record: Dict[str, Any]) -> bool:
+        """
+        Intègre un enregistrement (doit contenir un `timestamp`) dans tous les niveaux.
+        Retourne False, sans rien intégrer, si le timestamp a déjà été chargé par
+        `add_dataframe` ou s'il est trop loin dans le futur.
+        """
+        seconds = self._to_seconds(record['timestamp'])
+        if seconds in self.seeded_seconds or seconds > time.time() + self.max_future_skew:
+            return False
+        values = np.array([record.get(metric) for metric in self.metrics], dtype=float)
+        for tier in self.tiers:
+            tier.update(seconds, values)
+        if self.first_seconds is None or seconds < self.first_seconds:
+            self.first_seconds = seconds
+        if self.last_seconds is None or seconds > self.last_seconds:
+            self.last_seconds = seconds
+        return True
+
+    def add_dataframe(self, df: pd.DataFrame):
+        """
+        Charge l'historique d'un DataFrame issu de `ingest_data`. Les
+        enregistrements passés ensuite à `add` avec l'un de ces timestamps sont
+        ignorés.
+        """
+        if df.empty or not any(metric in df.columns for metric in self.metrics):
+            return
+        values = df.reindex(columns=self.metrics).to_numpy(dtype=float)
+        # Conversion indépendante de l'unité interne (ns, us, s...) du datetime
+        timestamps = pd.to_datetime(df['timestamp'], utc=True)
+        seconds = (timestamps - pd.Timestamp(0, tz='UTC')) // pd.Timedelta(seconds=1)
+        for ts, row in zip(seconds.to_numpy(), values):
+            for tier in self.tiers:
+                tier.update(int(ts), row)
+            if self.first_seconds is None or ts < self.first_seconds:
+                self.first_seconds = int(ts)
+            if self.last_seconds is None or ts > self.last_seconds:
+                self.last_seconds = int(ts)
+        self.seeded_seconds.update(int(ts) for ts in seconds.to_numpy())
+
+    def _resolve_range(self, start: Any, end: Any) -> Tuple[int, int]:
+        end_seconds = self._to_seconds(end) if end is not None else self.last_seconds
+        start_seconds = self._to_seconds(start) if start is not None else self.first_seconds
+        return start_seconds, end_seconds
+
+    def select_tier(self, start_seconds: int, end_seconds: int, max_points: int) -> RollupTier:
+        """Choisit le niveau le plus fin couvrant la plage en au plus `max_points` points."""
+        for tier in self.tiers:
+            if tier.covers(start_seconds) and tier.points_between(start_seconds, end_seconds) <= max_points:
+                return tier
+        return self.tiers[-1]
+
+    def query(self, metric: str, start: Any = None, end: Any = None, max_points: int = 500) -> pd.DataFrame:
+        """
+        Retourne la série agrégée d'une métrique sur la plage [start, end]
+        (par défaut tout l'historique connu), avec une colonne par agrégat.
+        """
+        columns = ['timestamp', 'min', 'max', 'mean', 'count', 'last']
+        if metric not in self._index or self.last_seconds is None:
+            return pd.DataFrame(columns=columns)
+
+        start_seconds, end_seconds = self._resolve_range(start, end)
+        tier = self.select_tier(start_seconds, end_seconds, max_points)
+        i = self._index[metric]
+        slots = tier.slots_between(i, start_seconds, end_seconds)
+        count = tier.count[slots, i]
+        return pd.DataFrame({
+            'timestamp': pd.to_datetime(tier.buckets[slots] * tier.resolution, unit='s', utc=True),
+            'min': tier.min[slots, i],
+            'max': tier.max[slots, i],
+            'mean': tier.sum[slots, i] / count,
+            'count': count,
+            'last': tier.last[slots, i],
+        }, columns=columns)
+
+    def summary(self, start: Any = None, end: Any = None, max_points: int = 500) -> Dict[str, Dict[str, Any]]:
+        """
+        Résumé par métrique (min/max/moyenne/nombre/dernière valeur) sur la plage,
+        calculé à partir des agrégats : utile comme contexte historique pour l'agent.
+        """
+        if self.last_seconds is None:
+            return {}
+
+        start_seconds, end_seconds = self._resolve_range(start, end)
+        tier = self.select_tier(start_seconds, end_seconds, max_points)
+        result = {}
+        for metric, i in self._index.items():
+            slots = tier.slots_between(i, start_seconds, end_seconds)
+            if len(slots) == 0:
+                continue
+            count = int(tier.count[slots, i].sum())
+            result[metric] = {
+                'min': float(tier.min[slots, i].min()),
+                'max': float(tier.max[slots, i].max()),
+                'mean': float(tier.sum[slots, i].sum() / count),
+                'count': count,
+                'last': float(tier.last[slots[-1], i]),
+                'resolution_seconds': tier.resolution,
+            }
+        return result
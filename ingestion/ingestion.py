@@ -1,7 +1,9 @@
 import pandas as pd
 import time
 import sys
-from typing import Iterator, Dict, Any, Optional
+import threading
+from collections.abc import Mapping
+from typing import Iterator, Dict, Any, Iterable, List, Optional, Tuple
 
 # Pour que Python puisse trouver le module dans le dossier voisin 'analyse'
 sys.path.append('.')
@@ -26,24 +28,153 @@ def ingest_data(file_path: str) -> Optional[pd.DataFrame]:
         print(f"❌ ERREUR lors de l'ingestion des données : {e}")
         return None
 
+class MetricRecord(Mapping):
+    """
+    Enregistrement compact et en lecture seule : un tuple de valeurs et un index
+    colonne -> position partagé par toutes les lignes d'un même DataFrame.
+    Il se manipule comme un dictionnaire (`record['cpu_usage']`, `.get()`,
+    `.keys()`, `dict(record)`) sans construire de Series ni de dict par ligne.
+    """
+    __slots__ = ('_index', '_values')
+
+    def __init__(self, index: Dict[str, int], values: Tuple[Any, ...]):
+        self._index = index
+        self._values = values
+
+    def __getitem__(self, key: str) -> Any:
+        return self._values[self._index[key]]
+
+    def __contains__(self, key: object) -> bool:
+        return key in self._index
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self._index)
+
+    def __len__(self) -> int:
+        return len(self._index)
+
+    def __repr__(self) -> str:
+        return repr(dict(self))
+
+
+def iter_records(df: pd.DataFrame) -> Iterator[MetricRecord]:
+    """Parcourt les lignes d'un DataFrame sous forme de `MetricRecord`."""
+    index = {column: i for i, column in enumerate(df.columns)}
+    for values in df.itertuples(index=False, name=None):
+        yield MetricRecord(index, values)
+
+
 # La fonction de simulation reste la même...
-def stream_data_simulator(df: pd.DataFrame, delay: float = 0.1) -> Iterator[Dict[str, Any]]:
+def stream_data_simulator(df: pd.DataFrame, delay: float = 0.1) -> Iterator[MetricRecord]:
     print("\n--- 🎬 Lancement de la simulation du flux de données ---")
     try:
-        for _, row in df.iterrows():
-            yield row.to_dict()
+        for record in iter_records(df):
+            yield record
             time.sleep(delay)
     except KeyboardInterrupt:
         print("\n--- 🛑 Simulation arrêtée. ---")
     finally:
         print("--- ✅ Fin du flux. ---")
         
+def normalize_record(record: Dict[str, Any], metrics: Iterable[str] = (),
+                     max_future_skew: pd.Timedelta = pd.Timedelta(minutes=5)) -> Dict[str, Any]:
+    """
+    Met un enregistrement brut (reçu d'un collecteur) au même format que les
+    lignes produites par `ingest_data` : timestamp converti et statuts de
+    service aplatis en colonnes `service_status_*`.
+    Lève une ValueError si le timestamp est absent, invalide ou postérieur à
+    l'heure courante de plus de `max_future_skew`, si l'une des
+    `metrics` est présente avec une valeur non numérique, ou si `service_status`
+    n'est pas un objet.
+    """
+    record = dict(record)
+    timestamp = record.get('timestamp')
+    if not isinstance(timestamp, str) or not timestamp.strip():
+        raise ValueError("champ 'timestamp' manquant ou invalide")
+    record['timestamp'] = pd.to_datetime(timestamp)
+    if pd.isna(record['timestamp']):
+        raise ValueError(f"timestamp invalide: {timestamp!r}")
+    if record['timestamp'].timestamp() > (pd.Timestamp.now(tz='UTC') + max_future_skew).timestamp():
+        raise ValueError(f"timestamp dans le futur: {timestamp!r}")
+
+    for metric in metrics:
+        value = record.get(metric)
+        if value is not None and (isinstance(value, bool) or not isinstance(value, (int, float))):
+            raise ValueError(f"valeur non numérique pour '{metric}': {value!r}")
+
+    service_status = record.pop('service_status', None)
+    if service_status is not None and not isinstance(service_status, dict):
+        raise ValueError(f"'service_status' doit être un objet JSON: {service_status!r}")
+    for service, status in (service_status or {}).items():
+        record[f'service_status_{service}'] = status
+    return record
+
+
+class MicroBatchBuffer:
+    """
+    Tampon de micro-batching pour l'ingestion en mode "push".
+    Les enregistrements sont accumulés puis libérés par lots d'au plus
+    `max_batch_size` enregistrements, dès que cette taille est atteinte ou que
+    le plus ancien enregistrement attend depuis plus de `max_delay` secondes.
+    Le tampon contient au plus `max_buffered` enregistrements et peut être
+    alimenté et vidé depuis des threads différents.
+    """
+
+    def __init__(self, max_batch_size: int = 200, max_delay: float = 1.0, max_buffered: int = 10000):
+        self.max_batch_size = max_batch_size
+        self.max_delay = max_delay
+        self.max_buffered = max_buffered
+        self._records: List[Dict[str, Any]] = []
+        self._oldest_at: Optional[float] = None
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._records)
+
+    def add(self, records: List[Dict[str, Any]]) -> int:
+        """
+        Ajoute des enregistrements au lot en cours, dans la limite de la place
+        disponible, et retourne le nombre d'enregistrements effectivement ajoutés.
+        """
+        with self._lock:
+            records = records[:max(self.max_buffered - len(self._records), 0)]
+            if records and self._oldest_at is None:
+                self._oldest_at = time.monotonic()
+            self._records.extend(records)
+            return len(records)
+
+    def is_due(self) -> bool:
+        """Indique si le lot en cours doit être traité (taille ou délai atteint)."""
+        with self._lock:
+            if not self._records:
+                return False
+            return (len(self._records) >= self.max_batch_size
+                    or time.monotonic() - self._oldest_at >= self.max_delay)
+
+    def drain(self) -> List[Dict[str, Any]]:
+        """Retire et retourne au plus `max_batch_size` enregistrements (les plus anciens)."""
+        with self._lock:
+            records = self._records[:self.max_batch_size]
+            self._records = self._records[self.max_batch_size:]
+            # S'il reste des enregistrements, la date du plus ancien est conservée :
+            # ils sont donc considérés comme dus et traités au tour suivant.
+            if not self._records:
+                self._oldest_at = None
+            return records
+
+
 # --- Point d'entrée principal (modifié) ---
 if __name__ == '__main__':
     # --- CONFIGURATION DE L'ANALYSE ---
     # C'est ici que l'on définit toutes nos règles. C'est facilement modifiable.
     ANALYSIS_CONFIG = {
         'rolling_window_size': 20, # Fenêtre pour la moyenne glissante
+        'seasonal_baseline': { # Ligne de base par jour de la semaine x heure
+            'enabled': False, # Si activé, remplace l'écart-type global pour les créneaux couverts
+            'std_factor': 3, # N x écart-type du créneau
+            'min_samples': 10, # Échantillons minimum avant d'utiliser un créneau
+            'timezone': 'UTC', # Fuseau des créneaux (ex: 'Europe/Paris' pour les heures locales)
+        },
         'metrics_to_check': {
             'cpu_usage': {
                 'threshold': 90, # Seuil critique
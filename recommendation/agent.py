@@ -69,6 +69,7 @@ def create_sre_agent():
     - **Toujours** inclure les valeurs numériques exactes dans les tableaux
     - **Utiliser** les émojis pour la gravité : 🔴 Critique, ⚠️ Avertissement, ✅ OK
     - **Baser** chaque recommandation sur des données concrètes
+    - **Consulter** l'outil `get_metrics_history` pour replacer le lot dans sa tendance (24h, 7 jours...)
     - **Prioriser** les actions par impact/effort
     - **Formater** en Markdown avec des tableaux bien structurés
     
@@ -85,8 +86,8 @@ def create_sre_agent():
                     url=MCP_SERVER_URL,
                     headers={'Accept': 'text/event-stream'},
                 ),
-                # On s'assure que l'agent ne peut utiliser que notre outil d'analyse
-                tool_filter=['analyze_metrics_batch'],
+                # On s'assure que l'agent ne peut utiliser que nos outils d'analyse
+                tool_filter=['analyze_metrics_batch', 'get_ingested_anomalies', 'get_metrics_history'],
             )
         ],
     )
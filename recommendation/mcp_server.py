@@ -1,20 +1,37 @@
 # recommendation/mcp_server.py
 import sys
+import json
+import asyncio
+import threading
 import pandas as pd
-from typing import List, Dict, Any
+from collections import deque
+from typing import List, Dict, Any, Optional
 
 # Ajouter la racine du projet au path pour permettre les imports
 # depuis les dossiers frères 'analyse' et 'ingestion'.
 sys.path.append('.')
 
 from mcp.server.fastmcp import FastMCP
+from starlette.requests import Request
+from starlette.responses import JSONResponse
 from analyse.analyse import AnomalyDetector
+from analyse.rollup import MetricRollup
 from ingestion.ingestion import ingest_data # Nécessaire pour pré-entraîner le détecteur
+from ingestion.ingestion import normalize_record, MicroBatchBuffer
 
 # --- Configuration du Serveur ---
 HOST = "localhost"
 PORT = 3000
 
+# Paramètres de l'ingestion "push" (endpoint HTTP /ingest, format NDJSON)
+INGEST_CONFIG = {
+    'max_batch_size': 200,      # Taille maximale d'un micro-batch
+    'max_delay_seconds': 1.0,   # Délai maximal avant traitement d'un lot incomplet
+    'max_stored_results': 1000, # Nombre d'enregistrements anormaux conservés
+    'max_buffered_records': 10000, # Au-delà, /ingest répond 429 (contre-pression)
+    'max_body_bytes': 5 * 1024 * 1024, # Taille maximale d'une requête /ingest
+}
+
 # --- Initialisation de l'Outil d'Analyse ---
 print("🔧 Initialisation du serveur MCP d'analyse...")
 
@@ -28,6 +45,8 @@ if initial_data_df is None:
 # 2. Définir la configuration pour la détection d'anomalies.
 ANALYSIS_CONFIG = {
     'rolling_window_size': 20,
+    # Désactivé : remplacerait le contrôle global par créneau, et rapport.json est trop court
+    'seasonal_baseline': {'enabled': False, 'std_factor': 3, 'min_samples': 10, 'timezone': 'UTC'},
     'metrics_to_check': {
         'cpu_usage': {'threshold': 90, 'global_std_factor': 3, 'rolling_std_factor': 2, 'delta_threshold': 20},
         'memory_usage': {'threshold': 85, 'global_std_factor': 3, 'rolling_std_factor': 2, 'delta_threshold': 20},
@@ -44,7 +63,13 @@ anomaly_detector.compute_global_stats(initial_df=initial_data_df)
 
 print(f"✅ Détecteur d'anomalies prêt.")
 
-# 4. Créer le serveur MCP.
+# 4. Agrégats multi-résolution de l'historique, alimentés par toutes les voies d'ingestion.
+metric_rollup = MetricRollup(list(ANALYSIS_CONFIG['metrics_to_check']))
+metric_rollup.add_dataframe(initial_data_df)
+# Les micro-batchs sont analysés dans un thread séparé : accès aux agrégats protégés
+rollup_lock = threading.Lock()
+
+# 5. Créer le serveur MCP.
 mcp = FastMCP("Serveur d'Analyse de Métriques", host=HOST, port=PORT)
 
 # --- Définition de l'Outil MCP ---
@@ -77,6 +102,8 @@ def analyze_metrics_batch(records: List[Dict[str, Any]]) -> Dict[str, Any]:
                     }
                 metrics_summary[metric]['values'].append(record[metric])
         
+        with rollup_lock:
+            metric_rollup.add(record)
         detected = anomaly_detector.detect(record)
         if detected:
             all_anomalies.append({
@@ -120,9 +147,198 @@ def analyze_metrics_batch(records: List[Dict[str, Any]]) -> Dict[str, Any]:
     
     return detailed_report
 
+@mcp.tool(description="Retourne l'historique agrégé (min/max/moyenne/nombre/dernière valeur) des métriques sur les N dernières heures.")
+def get_metrics_history(hours: float = 24, metric: str = "", max_points: int = 100) -> Dict[str, Any]:
+    """
+    Interroge les agrégats multi-résolution : le niveau (1 min, 5 min ou 1 h) est
+    choisi selon la plage demandée. Sans `metric`, retourne un résumé de toutes
+    les métriques ; sinon la série agrégée de la métrique demandée.
+    """
+    if metric_rollup.last_seconds is None:
+        return {"status": "NO_DATA"}
+    end = pd.Timestamp(metric_rollup.last_seconds, unit='s', tz='UTC')
+    start = end - pd.Timedelta(hours=hours)
+    print(f"MCP: Consultation de l'historique agrégé sur {hours}h ({metric or 'toutes les métriques'}).")
+
+    if not metric:
+        with rollup_lock:
+            summary = metric_rollup.summary(start, end, max_points=max_points)
+        return {
+            "status": "OK",
+            "time_range": {"start": str(start), "end": str(end)},
+            "metrics_history": summary,
+        }
+    if metric not in metric_rollup.metrics:
+        return {"status": "UNKNOWN_METRIC", "available_metrics": metric_rollup.metrics}
+
+    with rollup_lock:
+        series = metric_rollup.query(metric, start, end, max_points=max_points)
+    series['timestamp'] = series['timestamp'].astype(str)
+    return {
+        "status": "OK",
+        "metric": metric,
+        "time_range": {"start": str(start), "end": str(end)},
+        "points": series.to_dict(orient='records'),
+    }
+
+# --- Ingestion "push" par micro-batching ---
+# Les collecteurs envoient leurs métriques directement au serveur (NDJSON),
+# la détection tourne en continu sur des micro-batchs et l'agent ne fait
+# plus qu'interroger les résultats via `get_ingested_anomalies`.
+ingest_buffer = MicroBatchBuffer(
+    max_batch_size=INGEST_CONFIG['max_batch_size'],
+    max_delay=INGEST_CONFIG['max_delay_seconds'],
+    max_buffered=INGEST_CONFIG['max_buffered_records'],
+)
+# Détecteur dédié : son historique glissant (moyenne glissante, delta) ne doit
+# pas mélanger le flux des collecteurs avec les lots envoyés par l'agent.
+ingest_detector = AnomalyDetector(config=ANALYSIS_CONFIG)
+ingest_detector.compute_global_stats(initial_df=initial_data_df)
+ingested_anomalies = deque(maxlen=INGEST_CONFIG['max_stored_results'])
+ingest_stats = {'received': 0, 'rejected': 0, 'throttled': 0, 'processed': 0, 'failed': 0, 'rollup_skipped': 0, 'batches': 0, 'anomalous': 0}
+_flush_task: Optional[asyncio.Task] = None
+_flush_wakeup: Optional[asyncio.Event] = None
+
+
+def flush_ingest_buffer() -> int:
+    """
+    Analyse un micro-batch (au plus `max_batch_size` enregistrements) et
+    retourne le nombre d'enregistrements analysés sans erreur. Exécuté hors de la boucle
+    d'événements, par `_flush_loop`.
+    """
+    records = ingest_buffer.drain()
+    analysed = 0
+    for record in records:
+        try:
+            with rollup_lock:
+                if not metric_rollup.add(record):
+                    # Déjà présent dans l'historique chargé (ou trop dans le futur) :
+                    # analysé mais non réintégré aux agrégats
+                    ingest_stats['rollup_skipped'] += 1
+            detected = ingest_detector.detect(record)
+        except Exception as e:
+            # Un enregistrement invalide ne doit pas faire perdre le reste du lot
+            print(f"MCP: ❌ Enregistrement ignoré ({record.get('timestamp')}): {e}")
+            ingest_stats['failed'] += 1
+            continue
+        analysed += 1
+        if detected:
+            ingested_anomalies.append({
+                "timestamp": str(record.get('timestamp')),
+                "anomalies_detectees": detected
+            })
+            ingest_stats['anomalous'] += 1
+    if records:
+        ingest_stats['processed'] += analysed
+        ingest_stats['batches'] += 1
+        print(f"MCP: Micro-batch de {len(records)} enregistrements analysé ({analysed} valides).")
+    return analysed
+
+
+async def _flush_loop():
+    """
+    Traite les micro-batchs dès qu'un lot est complet (réveil par l'endpoint)
+    ou que le délai maximal est écoulé. La détection s'exécute dans un thread
+    pour ne pas bloquer la boucle d'événements partagée avec le transport SSE.
+    """
+    while True:
+        try:
+            await asyncio.wait_for(_flush_wakeup.wait(), timeout=INGEST_CONFIG['max_delay_seconds'])
+        except asyncio.TimeoutError:
+            pass
+        _flush_wakeup.clear()
+        while ingest_buffer.is_due():
+            try:
+                await asyncio.to_thread(flush_ingest_buffer)
+            except Exception as e:
+                print(f"MCP: ❌ Erreur lors de l'analyse d'un micro-batch: {e}")
+
+
+@mcp.custom_route("/ingest", methods=["POST"])
+async def ingest_endpoint(request: Request) -> JSONResponse:
+    """
+    Reçoit des enregistrements au format NDJSON (un objet JSON par ligne),
+    les valide, les place dans le tampon de micro-batching et acquitte
+    l'ensemble en une réponse. L'analyse est faite par `_flush_loop`.
+    Répond 413 si la requête dépasse `max_body_bytes`, et 429 si le tampon est
+    plein (les enregistrements déjà acceptés sont indiqués dans la réponse).
+    """
+    global _flush_task, _flush_wakeup
+    if _flush_task is None or _flush_task.done():
+        _flush_wakeup = asyncio.Event()
+        _flush_task = asyncio.create_task(_flush_loop())
+
+    # Taille de requête bornée, vérifiée aussi pendant la lecture (en-tête absent ou faux)
+    max_bytes = INGEST_CONFIG['max_body_bytes']
+    too_large = JSONResponse({"accepted": 0, "error": f"requête supérieure à {max_bytes} octets"}, status_code=413)
+    content_length = request.headers.get('content-length', '')
+    if content_length.isdigit() and int(content_length) > max_bytes:
+        return too_large
+    body = bytearray()
+    async for chunk in request.stream():
+        body.extend(chunk)
+        if len(body) > max_bytes:
+            return too_large
+
+    valid, errors = [], []
+    for line_number, raw_line in enumerate(bytes(body).splitlines(), start=1):
+        if not raw_line.strip():
+            continue
+        try:
+            record = json.loads(raw_line.decode('utf-8'))
+            if not isinstance(record, dict):
+                raise ValueError("l'enregistrement doit être un objet JSON")
+            valid.append((line_number, normalize_record(record, metrics=ANALYSIS_CONFIG['metrics_to_check'])))
+        except (ValueError, TypeError) as e:
+            # UnicodeDecodeError et JSONDecodeError sont des ValueError
+            errors.append({"line": line_number, "error": str(e)})
+
+    accepted = ingest_buffer.add([record for _, record in valid])
+    ingest_stats['received'] += accepted
+    ingest_stats['rejected'] += len(errors)
+    if len(ingest_buffer) >= ingest_buffer.max_batch_size:
+        _flush_wakeup.set()
+
+    response = {
+        "accepted": accepted,
+        "rejected": len(errors),
+        "errors": errors,
+        "buffered": len(ingest_buffer),
+    }
+    if accepted < len(valid):
+        # Tampon plein : le collecteur doit renvoyer les lignes à partir de `retry_from_line`
+        ingest_stats['throttled'] += len(valid) - accepted
+        response["throttled"] = len(valid) - accepted
+        response["retry_from_line"] = valid[accepted][0]
+        return JSONResponse(response, status_code=429, headers={"Retry-After": "1"})
+    return JSONResponse(response, status_code=200 if accepted or not errors else 400)
+
+
+@mcp.tool(description="Retourne les anomalies détectées sur les métriques poussées par les collecteurs (endpoint /ingest).")
+def get_ingested_anomalies(limit: int = 50) -> Dict[str, Any]:
+    """
+    Retourne les `limit` derniers enregistrements anormaux ainsi que les
+    statistiques d'ingestion. Les enregistrements encore dans le tampon
+    (`buffered`) sont analysés au plus tard après `max_delay_seconds`.
+    """
+    recent = list(ingested_anomalies)[-limit:] if limit > 0 else []
+    print(f"MCP: Consultation des anomalies ingérées ({len(recent)} retournées).")
+    return {
+        "status": "ANOMALIES_DETECTED" if recent else "OK",
+        "rapport_anomalies": recent,
+        "ingestion_stats": {**ingest_stats, "buffered": len(ingest_buffer)},
+        "configuration": {
+            "seuils_critiques": {
+                metric: config.get('threshold', 'N/A')
+                for metric, config in ANALYSIS_CONFIG['metrics_to_check'].items()
+            }
+        }
+    }
+
 # --- Exécution du Serveur ---
 if __name__ == "__main__":
     print(f"🚀 Démarrage du serveur MCP sur http://{HOST}:{PORT}")
+    print(f"📥 Ingestion NDJSON disponible sur http://{HOST}:{PORT}/ingest")
     print("Utilisez CTRL+C pour arrêter le serveur.")
     try:
         mcp.run(transport="sse")
@@ -4,15 +4,21 @@ import pandas as pd
 import time
 import sys
 import asyncio
-from typing import List, Dict, Any
+import queue
+import threading
+import concurrent.futures
+from typing import List, Dict, Any, Callable, Optional
 from dotenv import load_dotenv
+from streamlit.runtime.scriptrunner import add_script_run_ctx, get_script_run_ctx
 
 # Ajouter la racine du projet au path pour permettre les imports
 sys.path.append('.')
 
 from ingestion.ingestion import ingest_data, stream_data_simulator
+from analyse.rollup import MetricRollup
 from recommendation.agent import create_sre_agent
 from google.adk import Runner
+from google.adk.agents.run_config import RunConfig, StreamingMode
 from google.adk.artifacts import InMemoryArtifactService
 from google.adk.sessions import InMemorySessionService
 from google.genai import types
@@ -57,9 +63,9 @@ def initialize_session_state():
         st.session_state.live_log = []
     if 'agent_reports' not in st.session_state:
         st.session_state.agent_reports = []
-    if 'metrics_history' not in st.session_state:
-        # DataFrame pour stocker les données des graphiques
-        st.session_state.metrics_history = pd.DataFrame(columns=['timestamp', 'cpu_usage', 'latency_ms', 'error_rate'])
+    if 'metric_rollup' not in st.session_state:
+        # Agrégats multi-résolution (1 min / 5 min / 1 h) alimentant les graphiques
+        st.session_state.metric_rollup = MetricRollup(['cpu_usage', 'latency_ms', 'error_rate'])
     if 'data_stream' not in st.session_state:
         st.session_state.data_stream = None
     if 'batch_records' not in st.session_state:
@@ -70,6 +76,9 @@ def initialize_session_state():
         st.session_state.is_paused = False
     if 'waiting_for_continue' not in st.session_state:
         st.session_state.waiting_for_continue = False
+    if 'pending_report' not in st.session_state:
+        # (numéro de lot, texte partiel) du rapport en cours de streaming
+        st.session_state.pending_report = None
 
 
 async def initialize_agent_session():
@@ -82,8 +91,20 @@ async def initialize_agent_session():
         st.session_state.session_id = session.id
 
 
-async def invoke_agent_async(prompt: str) -> str:
-    """Invoke the agent asynchronously and return the response."""
+async def invoke_agent_async(
+    prompt: str,
+    on_partial: Optional[Callable[[str], None]] = None,
+    on_tool_event: Optional[Callable[[str], None]] = None,
+    stop_event: Optional[threading.Event] = None,
+) -> str:
+    """
+    Invoke the agent asynchronously and return the response.
+
+    La réponse est diffusée en streaming (SSE) : chaque fragment reçu de
+    `runner.run_async` est transmis à `on_partial` avec le texte cumulé, et les
+    appels/réponses d'outils sont signalés via `on_tool_event`. Si `stop_event`
+    est positionné, le flux d'événements est fermé à l'événement suivant.
+    """
     if st.session_state.session_id is None:
         await initialize_agent_session()
     
@@ -91,47 +112,113 @@ async def invoke_agent_async(prompt: str) -> str:
         role='user', parts=[types.Part.from_text(text=prompt)]
     )
     
-    response_parts = []
-    async for event in st.session_state.runner.run_async(
+    response_parts = []  # Textes finalisés (un par tour de l'agent)
+    current_part = ''    # Texte en cours de génération (fragments partiels)
+    events = st.session_state.runner.run_async(
         user_id=st.session_state.user_id,
         session_id=st.session_state.session_id,
         new_message=content,
-    ):
-        if event.content.parts and event.content.parts[0].text:
-            response_parts.append(event.content.parts[0].text)
-    
+        run_config=RunConfig(streaming_mode=StreamingMode.SSE),
+    )
+    try:
+        async for event in events:
+            if stop_event is not None and stop_event.is_set():
+                break
+
+            if on_tool_event is not None:
+                for call in event.get_function_calls():
+                    on_tool_event(f"🔧 Appel de l'outil `{call.name}`...")
+                for resp in event.get_function_responses():
+                    on_tool_event(f"✅ Réponse de l'outil `{resp.name}` reçue.")
+
+            if not (event.content and event.content.parts and event.content.parts[0].text):
+                continue
+
+            text = event.content.parts[0].text
+            if event.partial:
+                # Fragment incrémental : on l'ajoute au texte en cours
+                current_part += text
+            else:
+                # Événement final : il contient le texte complet du tour
+                response_parts.append(text)
+                current_part = ''
+
+            if on_partial is not None:
+                on_partial('\n'.join(response_parts + ([current_part] if current_part else [])))
+    finally:
+        await events.aclose()
+
+    if current_part:
+        response_parts.append(current_part)
     return '\n'.join(response_parts)
 
 
-def invoke_agent(prompt: str) -> str:
-    """Synchronous wrapper for the async agent invocation."""
-    try:
-        # Get or create event loop
+def invoke_agent(
+    prompt: str,
+    on_partial: Optional[Callable[[str], None]] = None,
+    on_tool_event: Optional[Callable[[str], None]] = None,
+    on_heartbeat: Optional[Callable[[float], None]] = None,
+) -> str:
+    """
+    Synchronous wrapper for the async agent invocation.
+
+    L'agent tourne dans un thread dédié avec sa propre boucle d'événements ;
+    ses mises à jour sont transmises par une file et les callbacks (qui
+    écrivent dans l'UI) s'exécutent dans le thread du script. `on_heartbeat`
+    est appelé environ chaque seconde avec le temps écoulé : Streamlit peut
+    ainsi interrompre le run même sans nouvel événement. Si le run est
+    interrompu, la tâche de l'agent est annulée.
+    """
+    callbacks = {'partial': on_partial, 'tool': on_tool_event}
+    updates = queue.Queue()
+    stop_event = threading.Event()
+    worker = {}  # Boucle et tâche de l'agent, pour pouvoir l'annuler
+    ctx = get_script_run_ctx()
+
+    def run_async():
+        # Rattache le thread au contexte Streamlit pour l'accès à `st.session_state`
+        add_script_run_ctx(threading.current_thread(), ctx)
+        new_loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(new_loop)
+        task = new_loop.create_task(invoke_agent_async(
+            prompt,
+            on_partial=lambda text: updates.put(('partial', text)),
+            on_tool_event=lambda message: updates.put(('tool', message)),
+            stop_event=stop_event,
+        ))
+        worker['loop'], worker['task'] = new_loop, task
         try:
-            loop = asyncio.get_event_loop()
-            if loop.is_running():
-                # If we're in a running event loop, we need to use a different approach
-                import threading
-                import concurrent.futures
-                
-                def run_async():
-                    new_loop = asyncio.new_event_loop()
-                    asyncio.set_event_loop(new_loop)
-                    try:
-                        return new_loop.run_until_complete(invoke_agent_async(prompt))
-                    finally:
-                        new_loop.close()
-                
-                with concurrent.futures.ThreadPoolExecutor() as executor:
-                    future = executor.submit(run_async)
-                    return future.result()
-            else:
-                return loop.run_until_complete(invoke_agent_async(prompt))
-        except RuntimeError:
-            # No event loop exists, create a new one
-            return asyncio.run(invoke_agent_async(prompt))
+            return new_loop.run_until_complete(task)
+        finally:
+            new_loop.close()
+
+    executor = concurrent.futures.ThreadPoolExecutor(max_workers=1)
+    started_at = last_beat = time.monotonic()
+    future = None
+    try:
+        future = executor.submit(run_async)
+        while not (future.done() and updates.empty()):
+            try:
+                kind, payload = updates.get(timeout=0.2)
+            except queue.Empty:
+                if on_heartbeat is not None and time.monotonic() - last_beat >= 1:
+                    last_beat = time.monotonic()
+                    on_heartbeat(last_beat - started_at)
+                continue
+            if callbacks[kind] is not None:
+                callbacks[kind](payload)
+        return future.result()
     except Exception as e:
         raise Exception(f"Error invoking agent: {str(e)}")
+    finally:
+        # En cas d'interruption, on arrête l'agent sans attendre la fin du thread
+        stop_event.set()
+        if 'task' in worker and future is not None and not future.done():
+            try:
+                worker['loop'].call_soon_threadsafe(worker['task'].cancel)
+            except RuntimeError:
+                pass  # Boucle déjà fermée : l'agent a terminé entre-temps
+        executor.shutdown(wait=False)
 
 
 def toggle_analysis():
@@ -141,10 +228,34 @@ def toggle_analysis():
         # Réinitialiser si on arrête
         st.session_state.data_stream = None
         st.session_state.batch_records = []
+        st.session_state.pending_report = None
         st.session_state.is_paused = False
         st.session_state.waiting_for_continue = False
 
 
+def render_charts(cpu_placeholder, latency_placeholder, history_hours: float):
+    """Affiche les graphiques à partir du niveau d'agrégation adapté à la plage demandée."""
+    rollup = st.session_state.metric_rollup
+    if rollup.last_seconds is None:
+        return
+    end = pd.Timestamp(rollup.last_seconds, unit='s', tz='UTC')
+    start = end - pd.Timedelta(hours=history_hours)
+    cpu_placeholder.line_chart(rollup.query('cpu_usage', start, end, max_points=300).set_index('timestamp')['mean'].rename('cpu_usage'))
+    latency_placeholder.line_chart(rollup.query('latency_ms', start, end, max_points=300).set_index('timestamp')['mean'].rename('latency_ms'))
+
+
+def cancel_agent_run():
+    """Annule la génération du rapport en cours en conservant le texte partiel."""
+    if st.session_state.pending_report is not None:
+        batch_num, partial_text = st.session_state.pending_report
+        st.session_state.agent_reports.insert(0, (batch_num, partial_text + "\n\n*⛔ Génération annulée par l'utilisateur.*"))
+        st.session_state.live_log.insert(0, f"--- ⛔ Rapport du Lot #{batch_num} annulé ---")
+        st.session_state.pending_report = None
+        st.session_state.batch_records = []
+        st.session_state.waiting_for_continue = True
+        st.session_state.is_paused = True
+
+
 def continue_analysis():
     """Fonction pour continuer l'analyse après une pause."""
     st.session_state.waiting_for_continue = False
@@ -160,6 +271,10 @@ st.markdown("Cette application simule un flux de données d'infrastructure, dét
 with st.sidebar:
     st.header("⚙️ Panneau de Contrôle")
     
+    # Les réglages sont désactivés pendant la génération d'un rapport : les
+    # modifier relancerait le script et interromprait l'agent.
+    generating = st.session_state.get('pending_report') is not None
+    
     # L'hyperparamètre pour la taille des lots
     batch_size = st.slider(
         "Taille des lots pour l'Agent", 
@@ -167,6 +282,7 @@ with st.sidebar:
         max_value=20, 
         value=3, 
         step=1,
+        disabled=generating,
         help="Nombre d'enregistrements à envoyer à l'agent en une seule fois."
     )
     
@@ -177,9 +293,21 @@ with st.sidebar:
         max_value=5.0, 
         value=1.0, 
         step=0.5,
+        disabled=generating,
         help="Délai entre chaque point de donnée pour ralentir ou accélérer la simulation."
     )
     
+    # Plage temporelle des graphiques (servie par les agrégats, pas par l'historique brut)
+    history_hours = st.slider(
+        "Plage d'historique affichée (heures)",
+        min_value=1,
+        max_value=168,
+        value=24,
+        step=1,
+        disabled=generating,
+        help="Les graphiques utilisent le niveau d'agrégation (1 min, 5 min ou 1 h) adapté à la plage choisie."
+    )
+    
     # Bouton pour démarrer ou arrêter l'analyse
     st.button(
         "Arrêter l'Analyse" if st.session_state.get('is_running', False) else "Démarrer l'Analyse",
@@ -216,7 +344,66 @@ live_log_placeholder = st.empty()
 
 
 # --- Logique Principale de l'Application ---
-if st.session_state.is_running and not st.session_state.get('waiting_for_continue', False):
+if st.session_state.is_running and st.session_state.pending_report is not None:
+    # Génération du rapport du lot en attente. Si ce run est interrompu par un
+    # autre moyen que les boutons Annuler/Arrêter, `pending_report` reste
+    # positionné et le même lot est simplement renvoyé au run suivant.
+    batch_num, _ = st.session_state.pending_report
+    render_charts(cpu_chart_placeholder, latency_chart_placeholder, history_hours)
+    live_log_placeholder.text_area("", value="\n".join(st.session_state.live_log), height=200)
+
+    prompt = f"Analyse ce lot de données de monitoring, fournis une synthèse et des recommandations. Lot de données: {st.session_state.batch_records}"
+
+    # Rapport diffusé progressivement dans son expander, au-dessus des précédents
+    with agent_reports_placeholder:
+        with st.expander(f"Rapport d'Analyse - Lot #{batch_num} (en cours...)", expanded=True):
+            st.button("Annuler la génération", on_click=cancel_agent_run, key=f"cancel_{batch_num}")
+            progress_placeholder = st.empty()
+            tool_status_placeholder = st.empty()
+            report_placeholder = st.empty()
+        for batch_num_prev, report in st.session_state.agent_reports:
+            with st.expander(f"Rapport d'Analyse - Lot #{batch_num_prev}", expanded=False):
+                st.markdown(report)
+    report_placeholder.markdown(f"⏳ L'agent SRE analyse le lot #{batch_num}...")
+
+    def render_partial(text: str):
+        st.session_state.pending_report = (batch_num, text)
+        report_placeholder.markdown(text + " ▌")
+
+    def render_tool_event(message: str):
+        tool_status_placeholder.caption(message)
+        st.session_state.live_log.insert(0, f"    {message}")
+
+    def render_heartbeat(elapsed: float):
+        progress_placeholder.caption(f"⏳ Génération en cours depuis {elapsed:.0f} s")
+
+    try:
+        agent_response = invoke_agent(
+            prompt,
+            on_partial=render_partial,
+            on_tool_event=render_tool_event,
+            on_heartbeat=render_heartbeat,
+        )
+        
+        st.session_state.agent_reports.insert(0, (batch_num, agent_response))
+        st.session_state.live_log.insert(0, f"--- ✅ Rapport de l'Agent reçu pour le Lot #{batch_num} ---")
+        
+        # Mettre l'analyse en pause après chaque rapport
+        st.session_state.waiting_for_continue = True
+        st.session_state.is_paused = True
+        
+    except Exception as e:
+        st.error(f"Erreur lors de l'invocation de l'agent pour le lot #{batch_num}: {e}")
+        st.session_state.live_log.insert(0, f"--- ❌ Erreur Agent pour le Lot #{batch_num} ---")
+
+    # Réinitialiser le lot
+    st.session_state.pending_report = None
+    st.session_state.batch_records = []
+    
+    # Forcer la mise à jour de l'affichage pour montrer le bouton "Continuer"
+    st.rerun()
+
+elif st.session_state.is_running and not st.session_state.get('waiting_for_continue', False):
     if st.session_state.data_stream is None:
         # Démarrer un nouveau flux si ce n'est pas déjà fait
         st.session_state.data_stream = stream_data_simulator(st.session_state.data_df, delay=0) # Le délai est géré par st.sleep
@@ -225,18 +412,9 @@ if st.session_state.is_running and not st.session_state.get('waiting_for_continu
         # Boucle sur le générateur de données
         record = next(st.session_state.data_stream)
         
-        # Mise à jour des données pour les graphiques
-        new_data = pd.DataFrame([{
-            "timestamp": pd.to_datetime(record['timestamp']),
-            "cpu_usage": record['cpu_usage'],
-            "latency_ms": record['latency_ms'],
-            "error_rate": record['error_rate']
-        }])
-        st.session_state.metrics_history = pd.concat([st.session_state.metrics_history, new_data], ignore_index=True).tail(100) # Garder les 100 derniers points
-        
-        # Mise à jour des graphiques
-        cpu_chart_placeholder.line_chart(st.session_state.metrics_history.set_index('timestamp')['cpu_usage'])
-        latency_chart_placeholder.line_chart(st.session_state.metrics_history.set_index('timestamp')['latency_ms'])
+        # Mise à jour des agrégats puis des graphiques
+        st.session_state.metric_rollup.add(record)
+        render_charts(cpu_chart_placeholder, latency_chart_placeholder, history_hours)
 
         # Ajout de l'enregistrement au lot en cours
         st.session_state.batch_records.append(record)
@@ -245,35 +423,14 @@ if st.session_state.is_running and not st.session_state.get('waiting_for_continu
         st.session_state.live_log.insert(0, f"✔️ ({pd.to_datetime(record['timestamp']).strftime('%H:%M:%S')}) Donnée reçue.")
         live_log_placeholder.text_area("", value="\n".join(st.session_state.live_log), height=200)
 
-        # Si le lot est plein, on l'envoie à l'agent
+        # Si le lot est plein, on planifie son envoi à l'agent : la génération
+        # a lieu au run suivant, avec les réglages désactivés
         if len(st.session_state.batch_records) >= batch_size:
             st.session_state.batch_counter += 1
             batch_num = st.session_state.batch_counter
             
             st.session_state.live_log.insert(0, f"--- 📦 Envoi du Lot #{batch_num} à l'agent... ---")
-            live_log_placeholder.text_area("", value="\n".join(st.session_state.live_log), height=200)
-
-            prompt = f"Analyse ce lot de données de monitoring, fournis une synthèse et des recommandations. Lot de données: {st.session_state.batch_records}"
-            
-            try:
-                with st.spinner(f"L'agent SRE analyse le lot #{batch_num}..."):
-                    agent_response = invoke_agent(prompt)
-                
-                st.session_state.agent_reports.insert(0, (batch_num, agent_response))
-                st.session_state.live_log.insert(0, f"--- ✅ Rapport de l'Agent reçu pour le Lot #{batch_num} ---")
-                
-                # Mettre l'analyse en pause après chaque rapport
-                st.session_state.waiting_for_continue = True
-                st.session_state.is_paused = True
-                
-            except Exception as e:
-                st.error(f"Erreur lors de l'invocation de l'agent pour le lot #{batch_num}: {e}")
-                st.session_state.live_log.insert(0, f"--- ❌ Erreur Agent pour le Lot #{batch_num} ---")
-
-            # Réinitialiser le lot
-            st.session_state.batch_records = []
-            
-            # Forcer la mise à jour de l'affichage pour montrer le bouton "Continuer"
+            st.session_state.pending_report = (batch_num, '')
             st.rerun()
 
         # Affichage des rapports de l'agent
@@ -300,9 +457,7 @@ elif not st.session_state.get('is_running', False) and len(st.session_state.get(
     st.info("L'analyse est arrêtée. Voici les derniers rapports générés.")
     
     # Affichage des graphiques même quand l'analyse est arrêtée
-    if not st.session_state.metrics_history.empty:
-        cpu_chart_placeholder.line_chart(st.session_state.metrics_history.set_index('timestamp')['cpu_usage'])
-        latency_chart_placeholder.line_chart(st.session_state.metrics_history.set_index('timestamp')['latency_ms'])
+    render_charts(cpu_chart_placeholder, latency_chart_placeholder, history_hours)
     
     # Affichage des rapports de l'agent même quand l'analyse est arrêtée
     with agent_reports_placeholder:
@@ -312,9 +467,7 @@ elif not st.session_state.get('is_running', False) and len(st.session_state.get(
 
 elif st.session_state.get('waiting_for_continue', False):
     # Affichage des graphiques même pendant la pause
-    if not st.session_state.metrics_history.empty:
-        cpu_chart_placeholder.line_chart(st.session_state.metrics_history.set_index('timestamp')['cpu_usage'])
-        latency_chart_placeholder.line_chart(st.session_state.metrics_history.set_index('timestamp')['latency_ms'])
+    render_charts(cpu_chart_placeholder, latency_chart_placeholder, history_hours)
     
     # Affichage des rapports quand on attend la continuation
     with agent_reports_placeholder:
@@ -0,0 +1,164 @@
+import sys
+from typing import Any, Dict, List
+
+import numpy as np
+import pandas as pd
+
+sys.path.append('.')
+
+from analyse.analyse import AnomalyDetector, SeasonalBaseline
+from ingestion.ingestion import ingest_data, iter_records
+
+CONFIG = {
+    'rolling_window_size': 20,
+    'metrics_to_check': {
+        'cpu_usage': {'threshold': 90, 'global_std_factor': 3, 'rolling_std_factor': 2, 'delta_threshold': 20},
+        'memory_usage': {'threshold': 85, 'global_std_factor': 3, 'rolling_std_factor': 2, 'delta_threshold': 20},
+        'disk_usage': {'threshold': 90, 'global_std_factor': 3, 'rolling_std_factor': 2},
+        'latency_ms': {'threshold': 300, 'global_std_factor': 3, 'rolling_std_factor': 2.5, 'delta_threshold': 100},
+        'error_rate': {'threshold': 0.1, 'delta_threshold': 0.05},
+        'temperature_celsius': {'threshold': 80}
+    }
+}
+
+
+class DataFrameDetector(AnomalyDetector):
+    """Implémentation d'origine de `detect` (historique en DataFrame), servant de référence."""
+
+    def __init__(self, config: Dict[str, Any]):
+        super().__init__(config)
+        self.history = pd.DataFrame()
+
+    def detect(self, record: Dict[str, Any]) -> List[str]:
+        anomalies = []
+        record_s = pd.Series(record)
+        self.history = pd.concat([self.history, pd.DataFrame([record])], ignore_index=True)
+        window = self.config.get('rolling_window_size', 20)
+        self.history = self.history.tail(window)
+
+        for col in [c for c in record_s.index if 'service_status_' in c]:
+            if record_s[col] in ['offline', 'degraded']:
+                anomalies.append(f"ALERTE: Le service '{col.replace('service_status_', '')}' est {record_s[col].upper()}.")
+
+        for metric in self.config['metrics_to_check']:
+            if metric not in record_s or pd.isna(record_s[metric]):
+                continue
+            value = record_s[metric]
+            conf = self.config['metrics_to_check'][metric]
+            if 'threshold' in conf and value > conf['threshold']:
+                anomalies.append(f"CRITIQUE: '{metric}' ({value}) dépasse le seuil de {conf['threshold']}.")
+            mean_g = self.global_stats['mean'].get(metric, 0)
+            std_g = self.global_stats['std'].get(metric, 1)
+            if std_g > 0 and abs(value - mean_g) > conf.get('global_std_factor', 3) * std_g:
+                anomalies.append(f"AVERTISSEMENT: '{metric}' ({value}) est anormalement éloigné de la moyenne globale ({mean_g:.2f}).")
+            if len(self.history) > 1:
+                mean_r = self.history[metric].rolling(window=window, min_periods=2).mean().iloc[-1]
+                std_r = self.history[metric].rolling(window=window, min_periods=2).std().iloc[-1]
+                if pd.notna(std_r) and std_r > 0 and abs(value - mean_r) > conf.get('rolling_std_factor', 2) * std_r:
+                    anomalies.append(f"AVERTISSEMENT: '{metric}' ({value}) dévie de sa moyenne glissante ({mean_r:.2f}).")
+                prev_value = self.history[metric].iloc[-2]
+                delta = value - prev_value
+                if 'delta_threshold' in conf and delta > conf['delta_threshold']:
+                    anomalies.append(f"INFO: Hausse rapide de '{metric}' de {delta:.2f}.")
+        return anomalies
+
+
+def test_deque_history_matches_dataframe_implementation():
+    df = ingest_data('rapport.json')
+    records = [dict(record) for record in iter_records(df)]
+    # Enregistrements avec une métrique absente au milieu du flux
+    records[50].pop('cpu_usage')
+    records[51].pop('latency_ms')
+    records[52].pop('cpu_usage')
+
+    reference = DataFrameDetector(CONFIG)
+    reference.compute_global_stats(df)
+    detector = AnomalyDetector(CONFIG)
+    detector.compute_global_stats(df)
+
+    for record in records:
+        assert detector.detect(record) == reference.detect(record)
+
+
+def test_null_metric_is_treated_as_missing():
+    # L'implémentation DataFrame levait une TypeError sur le delta suivant une valeur None
+    df = ingest_data('rapport.json')
+    records = [dict(record) for record in iter_records(df)]
+    with_null = AnomalyDetector(CONFIG)
+    with_null.compute_global_stats(df)
+    without_key = AnomalyDetector(CONFIG)
+    without_key.compute_global_stats(df)
+
+    for i, record in enumerate(records):
+        null_record, missing_record = dict(record), dict(record)
+        if i % 7 == 3:
+            null_record['latency_ms'] = None
+            missing_record.pop('latency_ms')
+        assert with_null.detect(null_record) == without_key.detect(missing_record)
+
+
+def test_detect_accepts_metric_records():
+    df = ingest_data('rapport.json')
+    from_dicts = AnomalyDetector(CONFIG)
+    from_dicts.compute_global_stats(df)
+    from_records = AnomalyDetector(CONFIG)
+    from_records.compute_global_stats(df)
+
+    for record in iter_records(df):
+        assert from_records.detect(record) == from_dicts.detect(dict(record))
+
+
+def test_seasonal_incremental_updates_match_groupby_var():
+    df = ingest_data('rapport.json')
+    metrics = list(CONFIG['metrics_to_check'])
+    half = len(df) // 2
+
+    incremental = SeasonalBaseline(metrics)
+    incremental.fit(df.iloc[:half])
+    for record in iter_records(df.iloc[half:]):
+        buckets = incremental.buckets(record['timestamp'])
+        for i, metric in enumerate(metrics):
+            incremental.update(buckets, i, record[metric])
+
+    full = SeasonalBaseline(metrics)
+    full.fit(df)
+
+    np.testing.assert_array_equal(incremental.count, full.count)
+    np.testing.assert_allclose(incremental.mean, full.mean)
+    np.testing.assert_allclose(incremental.m2, full.m2, atol=1e-9)
+
+
+def test_seasonal_baseline_ignores_replayed_training_data():
+    df = ingest_data('rapport.json')
+    config = {**CONFIG, 'seasonal_baseline': {'enabled': True, 'min_samples': 2}}
+    detector = AnomalyDetector(config)
+    detector.compute_global_stats(df)
+    count = detector.seasonal.count.copy()
+
+    for record in iter_records(df):
+        detector.detect(record)
+
+    np.testing.assert_array_equal(detector.seasonal.count, count)
+
+
+def test_seasonal_buckets_use_configured_timezone():
+    utc = SeasonalBaseline(['cpu_usage'])
+    paris = SeasonalBaseline(['cpu_usage'], timezone='Europe/Paris')
+    # Dimanche 22h UTC = lundi 00h à Paris (heure d'été, UTC+2)
+    timestamp = pd.Timestamp('2023-10-01T22:00:00Z')
+
+    assert utc.buckets(timestamp) == (6 * 24 + 22, SeasonalBaseline.WEEKLY_BUCKETS + 22)
+    assert paris.buckets(timestamp) == (0, SeasonalBaseline.WEEKLY_BUCKETS + 0)
+    assert paris.buckets(timestamp.tz_localize(None)) == paris.buckets(timestamp)
+
+
+def test_seasonal_fit_and_buckets_agree_on_timezone():
+    df = ingest_data('rapport.json')
+    baseline = SeasonalBaseline(['cpu_usage'], min_samples=1, timezone='America/New_York')
+    baseline.fit(df)
+
+    for record in iter_records(df):
+        weekly, hourly = baseline.buckets(record['timestamp'])
+        assert baseline.count[weekly, 0] > 0
+        assert baseline.count[hourly, 0] > 0
+    assert baseline.count[:SeasonalBaseline.WEEKLY_BUCKETS, 0].sum() == len(df)
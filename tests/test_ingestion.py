@@ -0,0 +1,87 @@
+import sys
+import time
+
+import pandas as pd
+import pytest
+
+sys.path.append('.')
+
+from ingestion.ingestion import MicroBatchBuffer, normalize_record
+
+METRICS = ['cpu_usage', 'latency_ms']
+
+
+def test_drain_never_exceeds_max_batch_size():
+    buffer = MicroBatchBuffer(max_batch_size=3, max_delay=60)
+    buffer.add([{'n': i} for i in range(7)])
+
+    batches = [buffer.drain() for _ in range(4)]
+
+    assert [len(batch) for batch in batches] == [3, 3, 1, 0]
+    assert [record['n'] for batch in batches for record in batch] == list(range(7))
+
+
+def test_is_due_on_size():
+    buffer = MicroBatchBuffer(max_batch_size=3, max_delay=60)
+    buffer.add([{}, {}])
+    assert not buffer.is_due()
+    buffer.add([{}])
+    assert buffer.is_due()
+
+
+def test_is_due_on_delay():
+    buffer = MicroBatchBuffer(max_batch_size=100, max_delay=0.05)
+    assert not buffer.is_due()
+    buffer.add([{}])
+    assert not buffer.is_due()
+    time.sleep(0.06)
+    assert buffer.is_due()
+
+
+def test_add_respects_max_buffered():
+    buffer = MicroBatchBuffer(max_batch_size=2, max_delay=60, max_buffered=5)
+
+    assert buffer.add([{}] * 4) == 4
+    assert buffer.add([{}] * 4) == 1
+    assert buffer.add([{}]) == 0
+    buffer.drain()
+    assert buffer.add([{}] * 4) == 2
+    assert len(buffer) == 5
+
+
+def test_normalize_record_parses_timestamp_and_flattens_service_status():
+    record = normalize_record({
+        'timestamp': '2023-10-01T12:00:00Z',
+        'cpu_usage': 42,
+        'service_status': {'database': 'online', 'cache': 'degraded'},
+    }, metrics=METRICS)
+
+    assert record == {
+        'timestamp': pd.Timestamp('2023-10-01T12:00:00Z'),
+        'cpu_usage': 42,
+        'service_status_database': 'online',
+        'service_status_cache': 'degraded',
+    }
+
+
+@pytest.mark.parametrize('record', [
+    {'cpu_usage': 42},
+    {'timestamp': None},
+    {'timestamp': ''},
+    {'timestamp': 1696161600},
+    {'timestamp': 'pas une date'},
+    {'timestamp': '2023-10-01T12:00:00Z', 'cpu_usage': 'high'},
+    {'timestamp': '2023-10-01T12:00:00Z', 'latency_ms': True},
+    {'timestamp': '2023-10-01T12:00:00Z', 'service_status': 'up'},
+    {'timestamp': str(pd.Timestamp.now(tz='UTC') + pd.Timedelta(days=1))},
+])
+def test_normalize_record_rejects_invalid_records(record):
+    with pytest.raises(ValueError):
+        normalize_record(record, metrics=METRICS)
+
+
+def test_normalize_record_allows_missing_metrics_and_ignores_unchecked_fields():
+    record = normalize_record({'timestamp': '2023-10-01T12:00:00Z', 'host': 'web-1'}, metrics=METRICS)
+
+    assert record['host'] == 'web-1'
+    assert 'cpu_usage' not in record
@@ -0,0 +1,90 @@
+import sys
+
+import numpy as np
+import pandas as pd
+
+sys.path.append('.')
+
+from analyse.rollup import MetricRollup
+
+
+def _records(start: str, minutes: int):
+    """Un point toutes les 30 secondes, avec des valeurs variées."""
+    rng = np.random.default_rng(0)
+    timestamps = pd.date_range(start, periods=minutes * 2, freq='30s', tz='UTC')
+    return [{'timestamp': ts, 'cpu': float(v)} for ts, v in zip(timestamps, rng.uniform(0, 100, len(timestamps)))]
+
+
+def test_ring_buffer_wraparound_matches_resample():
+    # 5 cases d'une minute : après 12 minutes, seules les 5 dernières subsistent
+    rollup = MetricRollup(['cpu'], tiers=[(60, 5)])
+    records = _records('2023-10-01 12:00', 12)
+    for record in records:
+        rollup.add(record)
+
+    result = rollup.query('cpu', start=records[0]['timestamp']).set_index('timestamp')
+    expected = (pd.DataFrame(records).set_index('timestamp')['cpu']
+                .resample('1min').agg(['min', 'max', 'mean', 'count', 'last']).tail(5))
+
+    assert len(result) == 5
+    pd.testing.assert_frame_equal(result[['min', 'max', 'mean', 'count', 'last']], expected,
+                                  check_dtype=False, check_index_type=False, check_freq=False,
+                                  check_names=False)
+
+
+def test_late_record_outside_retention_is_ignored():
+    rollup = MetricRollup(['cpu'], tiers=[(60, 5)])
+    for record in _records('2023-10-01 12:00', 12):
+        rollup.add(record)
+    before = rollup.query('cpu')
+
+    rollup.add({'timestamp': pd.Timestamp('2023-10-01 12:01', tz='UTC'), 'cpu': 1000.0})
+
+    pd.testing.assert_frame_equal(rollup.query('cpu'), before)
+
+
+def test_tier_selection_keeps_point_count_bounded():
+    rollup = MetricRollup(['cpu'], tiers=[(60, 600), (300, 600)])
+    for record in _records('2023-10-01 00:00', 300):
+        rollup.add(record)
+
+    assert len(rollup.query('cpu', max_points=299)) == 300 / 5
+    assert len(rollup.query('cpu', max_points=1000)) == 300
+
+
+def test_add_dataframe_matches_add_and_skips_replayed_records():
+    records = _records('2023-10-01 12:00', 30)
+    df = pd.DataFrame(records)
+    # L'unité interne du datetime ne doit pas changer les secondes calculées
+    df['timestamp'] = df['timestamp'].dt.as_unit('s')
+
+    seeded = MetricRollup(['cpu'])
+    seeded.add_dataframe(df)
+    streamed = MetricRollup(['cpu'])
+    for record in records:
+        streamed.add(record)
+
+    assert seeded.summary() == streamed.summary()
+    # Rejouer les mêmes données ne double pas les compteurs
+    assert not any(seeded.add(record) for record in records)
+    assert seeded.summary() == streamed.summary()
+
+
+def test_backfill_between_seeded_timestamps_is_kept():
+    records = _records('2023-10-01 12:00', 30)
+    rollup = MetricRollup(['cpu'])
+    rollup.add_dataframe(pd.DataFrame(records[::2]))
+
+    assert not rollup.add(records[0])
+    assert rollup.add(records[1])
+    assert rollup.summary()['cpu']['count'] == len(records[::2]) + 1
+
+
+def test_future_timestamp_does_not_shift_retention():
+    rollup = MetricRollup(['cpu'], tiers=[(60, 5)])
+    now = pd.Timestamp.now(tz='UTC').floor('min')
+    rollup.add({'timestamp': now, 'cpu': 1.0})
+
+    assert not rollup.add({'timestamp': now + pd.Timedelta(days=365), 'cpu': 2.0})
+    assert rollup.last_seconds == int(now.timestamp())
+    assert rollup.query('cpu')['last'].tolist() == [1.0]